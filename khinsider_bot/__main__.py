@@ -1,14 +1,22 @@
 import logging
 import sys
 from argparse import ArgumentParser
-from asyncio import run
+from asyncio import create_task, run
+from pathlib import Path
 
 from khinsider.cache import CacheManager
 
-from khinsider_bot.asgi import webserver
+from khinsider_bot.asgi import starlette_app, webserver
 from khinsider_bot.bot import bot, dispatcher
-from khinsider_bot.config import TELEGRAM_SECRET_TOKEN, TELEGRAM_WEBHOOK_URL
+from khinsider_bot.catalog import crawler
+from khinsider_bot.config import (
+    CATALOG_CRAWL_INTERVAL,
+    CATALOG_CRAWLER_ENABLED,
+    TELEGRAM_SECRET_TOKEN,
+    TELEGRAM_WEBHOOK_URL,
+)
 from khinsider_bot.constants import BOT_DATA_PATH
+from khinsider_bot.replay import load_recording, replay, UpdateRecorder
 
 cache_manager = CacheManager.get_manager()
 
@@ -18,12 +26,38 @@ def construct_argparser() -> ArgumentParser:
     modes = parser.add_mutually_exclusive_group(required=True)
     modes.add_argument('-w', '--webhook', action='store_true')
     modes.add_argument('-p', '--polling', action='store_true')
+    modes.add_argument(
+        '-r',
+        '--replay',
+        type=Path,
+        metavar='FILE',
+        help='replay recorded updates against local stand-ins',
+    )
+
+    parser.add_argument(
+        '--record',
+        type=Path,
+        metavar='FILE',
+        help='record anonymized webhook updates to jsonl file',
+    )
+    parser.add_argument(
+        '--speedup',
+        type=float,
+        default=1.0,
+        help='replay updates this many times faster than recorded',
+    )
 
     return parser
 
 
 async def main() -> None:
-    args = construct_argparser().parse_args()
+    parser = construct_argparser()
+    args = parser.parse_args()
+
+    if args.record and not args.webhook:
+        parser.error('--record can only be used in webhook mode')
+    if not args.speedup > 0:
+        parser.error('--speedup must be positive')
 
     logging.basicConfig(
         level=logging.INFO,
@@ -36,8 +70,19 @@ async def main() -> None:
             logging.StreamHandler(sys.stdout),
         ],
     )
+    crawler_task = (
+        create_task(crawler.run(CATALOG_CRAWL_INTERVAL))
+        if CATALOG_CRAWLER_ENABLED and not args.replay
+        else None
+    )
+
     try:
         if args.webhook:
+            if args.record:
+                starlette_app.state.update_recorder = UpdateRecorder(
+                    args.record
+                )
+
             await bot.set_webhook(
                 url=TELEGRAM_WEBHOOK_URL,
                 secret_token=TELEGRAM_SECRET_TOKEN,
@@ -47,7 +92,16 @@ async def main() -> None:
             await bot.delete_webhook(drop_pending_updates=True)
         elif args.polling:
             await dispatcher.start_polling(bot)
+        elif args.replay:
+            report = await replay(
+                dispatcher,
+                load_recording(args.replay),
+                speedup=args.speedup,
+            )
+            print(report.format())
     finally:
+        if crawler_task:
+            crawler_task.cancel()
         cache_manager.stop_garbage_collector()
 
 
@@ -1,4 +1,5 @@
 from concurrent.futures import ThreadPoolExecutor
+from secrets import compare_digest
 
 from starlette.applications import Starlette
 from starlette.background import BackgroundTask
@@ -8,16 +9,24 @@ from starlette.routing import Route
 from uvicorn import Config, Server
 
 from .bot import bot, dispatcher
-from .config import WEBSERVER_HOST, WEBSERVER_PORT
+from .config import ADMIN_TOKEN, WEBSERVER_HOST, WEBSERVER_PORT
+from .enums import ProfileDump
+from .metrics import render_metrics
+from .profiling import profiler
 
 executor = ThreadPoolExecutor(max_workers=5)
 
 
 async def telegram(request: Request) -> Response:
+    update = await request.json()
+
+    if update_recorder := request.app.state.update_recorder:
+        update_recorder.record(update)
+
     task = BackgroundTask(
         dispatcher.feed_webhook_update,
         bot=bot,
-        update=await request.json(),
+        update=update,
     )
     return Response(background=task)
 
@@ -27,12 +36,44 @@ async def health(_: Request) -> PlainTextResponse:
     return PlainTextResponse(content='The bot is still running fine :)')
 
 
+async def metrics(_: Request) -> PlainTextResponse:
+    """Expose bot metrics in prometheus text format."""
+    return PlainTextResponse(content=render_metrics())
+
+
+async def profiling(request: Request) -> PlainTextResponse:
+    """Show profiler status or switch it on and off."""
+    if not ADMIN_TOKEN or not compare_digest(
+        request.headers.get('X-Admin-Token', ''),
+        ADMIN_TOKEN,
+    ):
+        return PlainTextResponse(content='Forbidden', status_code=403)
+
+    if request.method == 'POST':
+        params = request.query_params
+        try:
+            percent = float(params.get('percent', '10'))
+            dump = ProfileDump(params.get('dump', ProfileDump.NONE))
+        except ValueError as e:
+            return PlainTextResponse(content=str(e), status_code=400)
+
+        if params.get('enabled') == '1':
+            profiler.enable(min(max(percent, 0), 100) / 100, dump)
+        else:
+            profiler.disable()
+
+    return PlainTextResponse(content=profiler.format_status())
+
+
 starlette_app = Starlette(
     routes=[
         Route('/', telegram, methods=['POST']),
         Route('/healthcheck/', health, methods=['GET']),
+        Route('/metrics/', metrics, methods=['GET']),
+        Route('/profiling/', profiling, methods=['GET', 'POST']),
     ]
 )
+starlette_app.state.update_recorder = None
 
 webserver = Server(
     config=Config(
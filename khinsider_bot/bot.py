@@ -13,8 +13,6 @@ from aiogram.types import (
 )
 from khinsider import (
     fetch_tracks,
-    get_album,
-    get_publisher_albums,
     get_track,
     KHINSIDER_URL_REGEX,
     parse_khinsider_url,
@@ -25,14 +23,27 @@ from khinsider.enums import AlbumTypes
 from khinsider.files import setup_download
 from magic_filter import RegexpMode
 
-from .config import TELEGRAM_TOKEN
-from .constants import LIST_PAGE_LENGTH, ROOT_DOWNLOADS_PATH
+from .catalog import catalog, get_album, get_publisher_albums
+from .config import ADMIN_IDS, MAX_CONCURRENT_UPDATES, TELEGRAM_TOKEN
+from .constants import (
+    LIST_PAGE_LENGTH,
+    ROOT_DOWNLOADS_PATH,
+    THROTTLE_LIMITS,
+)
 from .decorators import (
+    profile_handler,
     react_after,
     react_before,
     react_on_error,
 )
-from .enums import Emoji
+from .enums import AudioFormat, Emoji, ProfileDump
+from .profiling import profiler, span
+from .throttling import ThrottlingMiddleware
+from .transcoding import (
+    get_audio_format,
+    is_transcoding_available,
+    set_audio_format,
+)
 from .util import (
     format_search_results,
     get_list_select_keyboard,
@@ -47,8 +58,12 @@ bot = Bot(
     token=TELEGRAM_TOKEN,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML),
 )
+profiler.attach_session(bot.session)
 
 dispatcher = Dispatcher()
+dispatcher.update.outer_middleware(
+    ThrottlingMiddleware(THROTTLE_LIMITS, MAX_CONCURRENT_UPDATES)
+)
 
 
 async def handle_track_url(message: Message, match: Match) -> None:
@@ -57,7 +72,8 @@ async def handle_track_url(message: Message, match: Match) -> None:
     album_slug, track_name = parse_khinsider_url(message_text)
 
     try:
-        track = get_track(album_slug, track_name)
+        with span('scrape'):
+            track = get_track(album_slug, track_name)
 
     except Exception:
         await message.answer("Couldn't get track :-(")
@@ -79,6 +95,7 @@ async def handle_album_url(message: Message, match: Match) -> None:
 
 
 @dispatcher.callback_query(F.data.startswith('download_album://'))
+@profile_handler()
 async def handle_download_album_button(callback_query: CallbackQuery) -> None:
     message = callback_query.message
 
@@ -112,7 +129,13 @@ async def handle_download_album_button(callback_query: CallbackQuery) -> None:
         raise
 
     with setup_download(ROOT_DOWNLOADS_PATH) as download_dir:
-        for track in fetch_tracks(*album.track_urls):
+        tracks = fetch_tracks(*album.track_urls)
+        # Each track page is scraped lazily by the generator.
+        while True:
+            with span('scrape'):
+                track = next(tracks, None)
+            if track is None:
+                break
             await send_audio_track(message, track, download_dir)
 
     await message.react([ReactionTypeEmoji(emoji=Emoji.THUMBS_UP)])
@@ -125,6 +148,7 @@ async def handle_download_album_button(callback_query: CallbackQuery) -> None:
         mode=RegexpMode.FINDITER,
     ).as_('match_iter')
 )
+@profile_handler()
 @react_before(emoji=Emoji.EYES)
 @react_on_error(emoji=Emoji.SEE_NO_EVIL)
 @react_after(emoji=Emoji.THUMBS_UP)
@@ -177,10 +201,46 @@ async def handle_help_command(message: Message) -> None:
         '- #com - Compilation albums\n'
         '- #sgl - Singles\n'
         '- #ins - Inspired albums [Inspired by]\n'
+        '\n'
+        'To choose audio format type /format [format]\n'
+        'Available formats:\n'
+        '- original - Send files as they are on khinsider\n'
+        '- aac - AAC 128 kbps\n'
+        '- opus - Opus 96 kbps, smallest files, sent as documents\n'
     )
 
 
+@dispatcher.message(Command('format'))
+async def handle_format_command(message: Message) -> None:
+    if not message.text:
+        logger.error('Empty message text!')
+        await message.answer('Unknown error!')
+        return
+
+    query = message.text.removeprefix('/format').strip().lower()
+
+    if not query:
+        await message.answer(
+            f'Current audio format: {get_audio_format(message.chat.id)}\n'
+            'Available formats: '
+            + ', '.join(audio_format for audio_format in AudioFormat)
+        )
+        return
+
+    if query not in AudioFormat:
+        await message.answer(f'Unknown audio format: {query}')
+        return
+
+    if query != AudioFormat.ORIGINAL and not is_transcoding_available():
+        await message.answer('Audio transcoding is not available right now!')
+        return
+
+    set_audio_format(message.chat.id, AudioFormat(query))
+    await message.answer(f'Audio format set to {query}')
+
+
 @dispatcher.message(Command('search'))
+@profile_handler()
 async def handle_search_command(message: Message) -> None:
     if not message.text:
         logger.error('Empty message text!')
@@ -207,7 +267,8 @@ async def handle_search_command(message: Message) -> None:
     else:
         album_type = AlbumTypes.EMPTY
 
-    search_results = search_albums(query, album_type=album_type)
+    with span('scrape'):
+        search_results = search_albums(query, album_type=album_type)
 
     if not search_results:
         await message.answer('I found nothing :(')
@@ -226,6 +287,7 @@ async def handle_search_command(message: Message) -> None:
 
 
 @dispatcher.message(Command('publisher'))
+@profile_handler()
 async def handle_publisher_command(message: Message) -> None:
     if not message.text:
         logger.error('Empty message text!')
@@ -238,12 +300,18 @@ async def handle_publisher_command(message: Message) -> None:
         await message.answer('Publisher name is required!')
         return
 
-    search_results = get_publisher_albums(query)
+    # Resolve typos against known publishers before scraping, so that
+    # a misspelled name is served from the catalog.
+    publisher = catalog.match_publisher(query) or query
+    if publisher != query:
+        await message.answer(f'Showing albums of {publisher}')
+
+    search_results = get_publisher_albums(publisher)
 
     if not search_results:
         await message.answer(
             'Publisher has no albums or name is incorrect!\n'
-            'Note: to find something publisher name must be exact match!'
+            'Note: check that publisher name is spelled as on khinsider.'
         )
         return
 
@@ -260,6 +328,7 @@ async def handle_publisher_command(message: Message) -> None:
 
 
 @dispatcher.callback_query(F.data.startswith('page://'))
+@profile_handler()
 async def handle_switch_page(callback_query: CallbackQuery) -> None:
     message = callback_query.message
 
@@ -304,6 +373,7 @@ async def handle_switch_page(callback_query: CallbackQuery) -> None:
 
 
 @dispatcher.callback_query(F.data.startswith('select://'))
+@profile_handler()
 async def handle_select_album(callback_query: CallbackQuery) -> None:
     message = callback_query.message
 
@@ -339,6 +409,38 @@ async def handle_select_album(callback_query: CallbackQuery) -> None:
     )
 
 
+@dispatcher.message(Command('profile'), F.from_user.id.in_(ADMIN_IDS))
+async def handle_profile_command(message: Message) -> None:
+    if not message.text:
+        logger.error('Empty message text!')
+        await message.answer('Unknown error!')
+        return
+
+    match message.text.removeprefix('/profile').split():
+        case []:
+            pass
+        case ['off']:
+            profiler.disable()
+        case ['on', *args] if len(args) <= 2:
+            percent = args[0] if args else '10'
+            dump = args[1] if len(args) > 1 else ProfileDump.NONE
+            if not percent.isdigit() or not 0 < int(percent) <= 100:
+                await message.answer('Sample percent must be from 1 to 100')
+                return
+            if dump not in ProfileDump:
+                await message.answer(
+                    'Dump must be one of: '
+                    + ', '.join(dump for dump in ProfileDump)
+                )
+                return
+            profiler.enable(int(percent) / 100, ProfileDump(dump))
+        case _:
+            await message.answer('Usage: /profile [on [percent] [dump] | off]')
+            return
+
+    await message.answer(profiler.format_status())
+
+
 @dispatcher.callback_query(F.data == ('dummy'))
 async def handle_dummy_data(callback_query: CallbackQuery) -> None:
     await callback_query.answer()
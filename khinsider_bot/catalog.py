@@ -0,0 +1,322 @@
+"""Local album catalog, warmed up by background crawler."""
+
+import asyncio
+import json
+import logging
+import sqlite3
+from collections.abc import Callable
+from dataclasses import dataclass
+from difflib import get_close_matches
+from pathlib import Path
+from time import time
+from typing import Any
+
+from khinsider import (
+    Album,
+    AlbumShort,
+    get_album as scrape_album,
+    get_publisher_albums as scrape_publisher_albums,
+    search_albums as scrape_search_results,
+)
+
+from .config import (
+    CATALOG_CRAWL_CONCURRENCY,
+    CATALOG_CRAWL_DELAY,
+    CATALOG_MAX_AGE,
+    CATALOG_REFRESH_AGE,
+    CATALOG_SEED_PUBLISHERS,
+    CATALOG_SEED_QUERIES,
+)
+from .constants import CATALOG_PATH
+from .metrics import inc_counter
+from .profiling import span
+
+logger = logging.getLogger('khinsider_bot')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS albums (
+    slug TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    year TEXT,
+    type TEXT,
+    track_count INTEGER,
+    thumbnail_urls TEXT NOT NULL,
+    track_urls TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS publishers (
+    name TEXT PRIMARY KEY COLLATE NOCASE,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS publisher_albums (
+    publisher TEXT NOT NULL COLLATE NOCASE,
+    position INTEGER NOT NULL,
+    slug TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (publisher, position)
+);
+"""
+
+
+@dataclass
+class CatalogAlbumShort:
+    slug: str
+    name: str
+
+
+@dataclass
+class CatalogAlbum:
+    slug: str
+    name: str
+    year: str
+    type: str
+    track_count: int
+    thumbnail_urls: list[str]
+    track_urls: list[str]
+
+
+class AlbumCatalog:
+    """SQLite storage of albums, publishers and their album lists."""
+
+    def __init__(self, path: Path, max_age: float) -> None:
+        self.max_age = max_age
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def is_fresh(self, updated_at: float, max_age: float | None) -> bool:
+        return time() - updated_at < (max_age or self.max_age)
+
+    def get_album(
+        self,
+        album_slug: str,
+        max_age: float | None = None,
+    ) -> CatalogAlbum | None:
+        row = self.connection.execute(
+            'SELECT name, year, type, track_count, thumbnail_urls,'
+            ' track_urls, updated_at FROM albums WHERE slug = ?',
+            (album_slug,),
+        ).fetchone()
+
+        if not row or not self.is_fresh(row[-1], max_age):
+            return None
+
+        name, year, type_, track_count, thumbnail_urls, track_urls, _ = row
+        return CatalogAlbum(
+            slug=album_slug,
+            name=name,
+            year=year,
+            type=type_,
+            track_count=track_count,
+            thumbnail_urls=json.loads(thumbnail_urls),
+            track_urls=json.loads(track_urls),
+        )
+
+    def save_album(self, album_slug: str, album: Album) -> None:
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO albums'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    album_slug,
+                    album.name,
+                    str(album.year),
+                    str(album.type),
+                    album.track_count,
+                    json.dumps(list(album.thumbnail_urls)),
+                    json.dumps(list(album.track_urls)),
+                    time(),
+                ),
+            )
+
+    def get_publisher_albums(
+        self,
+        publisher: str,
+        max_age: float | None = None,
+    ) -> list[CatalogAlbumShort] | None:
+        row = self.connection.execute(
+            'SELECT updated_at FROM publishers WHERE name = ?',
+            (publisher,),
+        ).fetchone()
+
+        if not row or not self.is_fresh(row[0], max_age):
+            return None
+
+        return [
+            CatalogAlbumShort(slug=slug, name=name)
+            for slug, name in self.connection.execute(
+                'SELECT slug, name FROM publisher_albums'
+                ' WHERE publisher = ? ORDER BY position',
+                (publisher,),
+            )
+        ]
+
+    def save_publisher_albums(
+        self,
+        publisher: str,
+        albums: list[AlbumShort],
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO publishers VALUES (?, ?)',
+                (publisher, time()),
+            )
+            self.connection.execute(
+                'DELETE FROM publisher_albums WHERE publisher = ?',
+                (publisher,),
+            )
+            self.connection.executemany(
+                'INSERT INTO publisher_albums VALUES (?, ?, ?, ?)',
+                [
+                    (publisher, position, album.slug, album.name)
+                    for position, album in enumerate(albums)
+                ],
+            )
+
+    def match_publisher(self, query: str) -> str | None:
+        """Find known publisher with name closest to the query."""
+        lowercase_names = {
+            name.lower(): name for name in self.get_publishers()
+        }
+
+        if matches := get_close_matches(
+            query.lower(),
+            lowercase_names,
+            n=1,
+            cutoff=0.6,
+        ):
+            return lowercase_names[matches[0]]
+        return None
+
+    def get_publishers(self) -> list[str]:
+        return [
+            name
+            for (name,) in self.connection.execute(
+                'SELECT name FROM publishers'
+            )
+        ]
+
+    def get_known_album_slugs(self) -> list[str]:
+        return [
+            slug
+            for (slug,) in self.connection.execute(
+                'SELECT slug FROM albums'
+                ' UNION SELECT slug FROM publisher_albums'
+            )
+        ]
+
+
+catalog = AlbumCatalog(CATALOG_PATH, max_age=CATALOG_MAX_AGE)
+
+
+def get_album(album_slug: str) -> Album | CatalogAlbum:
+    """Get album from the catalog, scraping khinsider if it is missing."""
+    if album := catalog.get_album(album_slug):
+        inc_counter('catalog_lookups_total', table='albums', result='hit')
+        return album
+
+    inc_counter('catalog_lookups_total', table='albums', result='miss')
+    with span('scrape'):
+        album = scrape_album(album_slug)
+    catalog.save_album(album_slug, album)
+    return album
+
+
+def get_publisher_albums(
+    publisher: str,
+) -> list[AlbumShort] | list[CatalogAlbumShort]:
+    """Get publisher albums from the catalog, scraping if they are missing."""
+    if (albums := catalog.get_publisher_albums(publisher)) is not None:
+        inc_counter('catalog_lookups_total', table='publishers', result='hit')
+        return albums
+
+    inc_counter('catalog_lookups_total', table='publishers', result='miss')
+    with span('scrape'):
+        albums = scrape_publisher_albums(publisher)
+    if albums:
+        catalog.save_publisher_albums(publisher, albums)
+    return albums
+
+
+class CatalogCrawler:
+    """Keep the catalog warm by politely re-scraping stale entries."""
+
+    def __init__(
+        self,
+        catalog: AlbumCatalog,
+        concurrency: int,
+        delay: float,
+        refresh_age: float,
+    ) -> None:
+        self.catalog = catalog
+        self.delay = delay
+        self.refresh_age = refresh_age
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def scrape(self, function: Callable, *args: str) -> Any:
+        """Run blocking scraper in a thread, limiting request rate."""
+        async with self.semaphore:
+            try:
+                return await asyncio.to_thread(function, *args)
+            except Exception:
+                inc_counter('catalog_crawl_errors_total')
+                logger.exception(f'Crawler failed to scrape {args}')
+                return None
+            finally:
+                await asyncio.sleep(self.delay)
+
+    async def crawl_publisher(self, publisher: str) -> None:
+        if (
+            self.catalog.get_publisher_albums(publisher, self.refresh_age)
+            is not None
+        ):
+            return
+
+        if albums := await self.scrape(scrape_publisher_albums, publisher):
+            self.catalog.save_publisher_albums(publisher, albums)
+
+    async def crawl_search_query(self, query: str) -> list[str]:
+        albums = await self.scrape(scrape_search_results, query)
+        return [album.slug for album in albums or []]
+
+    async def crawl_album(self, album_slug: str) -> None:
+        if self.catalog.get_album(album_slug, self.refresh_age):
+            return
+
+        if album := await self.scrape(scrape_album, album_slug):
+            self.catalog.save_album(album_slug, album)
+            inc_counter('catalog_crawled_albums_total')
+
+    async def crawl(self) -> None:
+        """Refresh stale publishers and albums, adding newly found ones."""
+        publishers = {*CATALOG_SEED_PUBLISHERS, *self.catalog.get_publishers()}
+        await asyncio.gather(*map(self.crawl_publisher, publishers))
+
+        found_slugs = await asyncio.gather(
+            *map(self.crawl_search_query, CATALOG_SEED_QUERIES)
+        )
+        album_slugs = {
+            *self.catalog.get_known_album_slugs(),
+            *(slug for slugs in found_slugs for slug in slugs),
+        }
+        await asyncio.gather(*map(self.crawl_album, album_slugs))
+
+    async def run(self, interval: float) -> None:
+        while True:
+            logger.info('Catalog crawl started')
+            try:
+                await self.crawl()
+            except Exception:
+                # One broken cycle must not stop the crawler for good.
+                logger.exception('Catalog crawl failed')
+                inc_counter('catalog_crawl_errors_total')
+            else:
+                logger.info('Catalog crawl finished')
+            await asyncio.sleep(interval)
+
+
+crawler = CatalogCrawler(
+    catalog,
+    concurrency=CATALOG_CRAWL_CONCURRENCY,
+    delay=CATALOG_CRAWL_DELAY,
+    refresh_age=CATALOG_REFRESH_AGE,
+)
@@ -5,3 +5,50 @@ WEBSERVER_HOST = os.getenv('HOSTNAME', 'localhost')
 WEBSERVER_PORT = int(os.getenv('PORT', '80'))
 TELEGRAM_WEBHOOK_URL = os.getenv('WEBHOOK_URL', '/')
 TELEGRAM_SECRET_TOKEN = os.getenv('WEBHOOK_TOKEN', 'no-token')
+
+# Comma separated telegram ids of users allowed to run admin commands.
+ADMIN_IDS = [
+    int(admin_id)
+    for admin_id in os.getenv('ADMIN_IDS', '').split(',')
+    if admin_id.strip()
+]
+# Token for admin http endpoints, which are disabled if it is empty.
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# Covers larger than this (in pixels) are downscaled before upload.
+# Set to 0 to disable.
+THUMBNAIL_MAX_SIZE = int(os.getenv('THUMBNAIL_MAX_SIZE', '1280'))
+
+# Number of worker processes used to transcode audio with ffmpeg.
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', '2'))
+# Least recently used transcoded tracks are removed above this size (MiB).
+TRANSCODE_CACHE_MAX_SIZE = (
+    int(os.getenv('TRANSCODE_CACHE_MAX_SIZE', '2048')) * 1024 * 1024
+)
+
+# Updates above this number being processed at once are rejected.
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '20'))
+
+# Background crawler keeping local album catalog warm.
+CATALOG_CRAWLER_ENABLED = os.getenv('CATALOG_CRAWLER', '0') == '1'
+CATALOG_CRAWL_CONCURRENCY = int(os.getenv('CATALOG_CRAWL_CONCURRENCY', '2'))
+# Pause (in seconds) after each khinsider request made by the crawler.
+CATALOG_CRAWL_DELAY = float(os.getenv('CATALOG_CRAWL_DELAY', '1'))
+CATALOG_CRAWL_INTERVAL = float(os.getenv('CATALOG_CRAWL_INTERVAL', '3600'))
+# Catalog entries older than this are scraped again on lookup.
+CATALOG_MAX_AGE = float(os.getenv('CATALOG_MAX_AGE', str(7 * 24 * 3600)))
+# Crawler refreshes entries older than this, before lookups have to.
+CATALOG_REFRESH_AGE = float(
+    os.getenv('CATALOG_REFRESH_AGE', str(CATALOG_MAX_AGE / 2))
+)
+# Comma separated publishers and search queries to discover albums from.
+CATALOG_SEED_PUBLISHERS = [
+    name.strip()
+    for name in os.getenv('CATALOG_SEED_PUBLISHERS', '').split(',')
+    if name.strip()
+]
+CATALOG_SEED_QUERIES = [
+    query.strip()
+    for query in os.getenv('CATALOG_SEED_QUERIES', '').split(',')
+    if query.strip()
+]
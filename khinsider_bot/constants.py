@@ -1,8 +1,32 @@
+import os
 from pathlib import Path
 
-BOT_DATA_PATH = Path('/bot_data')
+from .enums import RequestKind
+
+BOT_DATA_PATH = Path(os.getenv('BOT_DATA_PATH', '/bot_data'))
 
 ROOT_DOWNLOADS_PATH = BOT_DATA_PATH / 'downloads'
 ROOT_DOWNLOADS_PATH.mkdir(exist_ok=True, parents=True)
 
+THUMBNAIL_CACHE_PATH = BOT_DATA_PATH / 'thumbnails.json'
+AUDIO_FORMATS_PATH = BOT_DATA_PATH / 'audio_formats.json'
+CATALOG_PATH = BOT_DATA_PATH / 'catalog.sqlite3'
+
+ROOT_TRANSCODED_PATH = BOT_DATA_PATH / 'transcoded'
+ROOT_TRANSCODED_PATH.mkdir(exist_ok=True, parents=True)
+
+PROFILES_PATH = BOT_DATA_PATH / 'profiles'
+PROFILES_PATH.mkdir(exist_ok=True, parents=True)
+
 LIST_PAGE_LENGTH = 10
+
+# Sliding window limits per user: request kind -> (max requests, seconds).
+THROTTLE_LIMITS = {
+    RequestKind.KHINSIDER_URL: (5, 60),
+    RequestKind.SEARCH: (5, 60),
+    RequestKind.PUBLISHER: (5, 60),
+    RequestKind.DOWNLOAD_ALBUM: (2, 300),
+    RequestKind.SELECT_ALBUM: (10, 60),
+    RequestKind.SWITCH_PAGE: (30, 60),
+    RequestKind.OTHER: (20, 60),
+}
@@ -1,3 +1,4 @@
+import logging
 from collections.abc import Callable
 from functools import wraps
 
@@ -5,6 +6,10 @@ from aiogram.dispatcher.event.handler import CallbackType
 from aiogram.types import Message, ReactionTypeEmoji
 
 from .enums import Emoji
+from .metrics import inc_counter
+from .profiling import profiler
+
+logger = logging.getLogger('khinsider_bot')
 
 
 def react_before(
@@ -50,9 +55,31 @@ def react_on_error(
             try:
                 await handler(message, *args, **kwargs)
             except Exception:
+                logger.exception(f'{handler.__name__} failed')
+                inc_counter(
+                    'bot_handler_errors_total', handler=handler.__name__
+                )
                 await message.react([ReactionTypeEmoji(emoji=emoji)])
                 return
 
         return handler_wrapper
 
     return decorator
+
+
+def profile_handler() -> Callable[[CallbackType], CallbackType]:
+    """Time handler stages when update is sampled by the profiler."""
+
+    def decorator(handler: CallbackType) -> CallbackType:
+        @wraps(handler)
+        async def handler_wrapper(*args, **kwargs) -> None:
+            if not profiler.should_sample():
+                await handler(*args, **kwargs)
+                return
+
+            with profiler.trace(handler.__name__):
+                await handler(*args, **kwargs)
+
+        return handler_wrapper
+
+    return decorator
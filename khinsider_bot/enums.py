@@ -75,3 +75,25 @@ class Emoji(StrEnum):
     SHRUG = '🤷'
     WOMAN_SHRUGGING = '🤷‍♀️'
     POUTING_FACE = '😡'
+
+
+class AudioFormat(StrEnum):
+    ORIGINAL = 'original'
+    AAC = 'aac'
+    OPUS = 'opus'
+
+
+class RequestKind(StrEnum):
+    KHINSIDER_URL = 'khinsider_url'
+    SEARCH = 'search'
+    PUBLISHER = 'publisher'
+    DOWNLOAD_ALBUM = 'download_album'
+    SELECT_ALBUM = 'select_album'
+    SWITCH_PAGE = 'switch_page'
+    OTHER = 'other'
+
+
+class ProfileDump(StrEnum):
+    NONE = 'none'
+    CPROFILE = 'cprofile'
+    STACKS = 'stacks'
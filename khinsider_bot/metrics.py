@@ -0,0 +1,41 @@
+from collections import Counter
+
+MetricKey = tuple[str, tuple[tuple[str, str], ...]]
+
+_counters: Counter[MetricKey] = Counter()
+_gauges: dict[MetricKey, float] = {}
+
+
+def _make_key(name: str, labels: dict[str, object]) -> MetricKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc_counter(name: str, value: float = 1, **labels: object) -> None:
+    _counters[_make_key(name, labels)] += value
+
+
+def get_counter(name: str) -> float:
+    """Sum counter values across all label sets."""
+    return sum(
+        value for (key_name, _), value in _counters.items() if key_name == name
+    )
+
+
+def set_gauge(name: str, value: float, **labels: object) -> None:
+    _gauges[_make_key(name, labels)] = value
+
+
+def render_metrics() -> str:
+    """Render all metrics in prometheus text format."""
+
+    def format_metric(key: MetricKey, value: float) -> str:
+        name, labels = key
+        if not labels:
+            return f'{name} {value}'
+        labels_str = ','.join(f'{k}="{v}"' for k, v in labels)
+        return f'{name}{{{labels_str}}} {value}'
+
+    return ''.join(
+        f'{format_metric(key, value)}\n'
+        for key, value in sorted([*_counters.items(), *_gauges.items()])
+    )
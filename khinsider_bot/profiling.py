@@ -0,0 +1,199 @@
+"""Sampling profiler for update handlers, toggled at runtime."""
+
+import cProfile
+import logging
+from collections.abc import Generator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from random import random
+from time import perf_counter
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from .constants import PROFILES_PATH
+from .enums import ProfileDump
+from .metrics import inc_counter
+
+logger = logging.getLogger('khinsider_bot')
+
+
+@dataclass
+class Span:
+    name: str
+    started_at: float = field(default_factory=perf_counter)
+    children_time: float = 0.0
+
+
+_open_spans: ContextVar[tuple[Span, ...]] = ContextVar(
+    'open_spans',
+    default=(),
+)
+
+
+class Trace:
+    """Span timings of a single sampled update."""
+
+    def __init__(self, handler_name: str) -> None:
+        self.handler_name = handler_name
+        # Self time of every finished span by its full stack path.
+        self.self_times: dict[tuple[str, ...], float] = {}
+
+    @contextmanager
+    def span(self, name: str) -> Generator[None]:
+        # Open spans are kept per task, so concurrent stages don't mix up.
+        parents = _open_spans.get()
+        frame = Span(name)
+        token = _open_spans.set((*parents, frame))
+        try:
+            yield
+        finally:
+            _open_spans.reset(token)
+            duration = perf_counter() - frame.started_at
+
+            if parents:
+                parents[-1].children_time += duration
+
+            path = (self.handler_name, *(s.name for s in parents), name)
+            self.self_times[path] = self.self_times.get(path, 0) + max(
+                duration - frame.children_time, 0
+            )
+
+            inc_counter(
+                'profile_span_seconds_total',
+                duration,
+                handler=self.handler_name,
+                span=name,
+            )
+            inc_counter(
+                'profile_spans_total',
+                handler=self.handler_name,
+                span=name,
+            )
+
+    def format_stacks(self) -> str:
+        """Format self times as folded stacks, ready for flamegraph."""
+        return ''.join(
+            f'{";".join(path)} {round(self_time * 1_000_000)}\n'
+            for path, self_time in self.self_times.items()
+        )
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar(
+    'current_trace',
+    default=None,
+)
+
+
+class ProfilingRequestMiddleware(BaseRequestMiddleware):
+    """Time telegram api requests made while handling sampled updates."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        with span(f'telegram:{method.__api_method__}'):
+            return await make_request(bot, method)
+
+
+class Profiler:
+    """Sample updates and collect their span timings while enabled."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.dump = ProfileDump.NONE
+        self.sessions: list[BaseSession] = []
+        self.request_middleware = ProfilingRequestMiddleware()
+        self._cprofile_active = False
+
+    def attach_session(self, session: BaseSession) -> None:
+        """Time telegram requests of the bot session while enabled."""
+        self.sessions.append(session)
+
+    def enable(self, sample_rate: float, dump: ProfileDump) -> None:
+        if not self.enabled:
+            for session in self.sessions:
+                session.middleware(self.request_middleware)
+
+        self.sample_rate = sample_rate
+        self.dump = dump
+        self.enabled = True
+        logger.info(f'Profiling enabled: {sample_rate:.0%} of updates, {dump}')
+
+    def disable(self) -> None:
+        if self.enabled:
+            for session in self.sessions:
+                session.middleware.unregister(self.request_middleware)
+
+        self.enabled = False
+        logger.info('Profiling disabled')
+
+    def should_sample(self) -> bool:
+        return self.enabled and random() < self.sample_rate
+
+    def format_status(self) -> str:
+        if not self.enabled:
+            return 'Profiling is disabled'
+        status = (
+            f'Profiling {self.sample_rate:.0%} of updates, dump: {self.dump}'
+        )
+        if self.dump == ProfileDump.CPROFILE:
+            status += (
+                '\nNote: cProfile covers the whole event loop, so its stats'
+                ' include updates handled concurrently with the sampled one'
+            )
+        return status
+
+    @contextmanager
+    def trace(self, handler_name: str) -> Generator[None]:
+        trace = Trace(handler_name)
+        token = _current_trace.set(trace)
+
+        # Only one cProfile profiler may be active at a time.
+        profile = None
+        if self.dump == ProfileDump.CPROFILE and not self._cprofile_active:
+            self._cprofile_active = True
+            profile = cProfile.Profile()
+            profile.enable()
+
+        try:
+            with trace.span('total'):
+                yield
+        finally:
+            _current_trace.reset(token)
+
+            if profile:
+                profile.disable()
+                self._cprofile_active = False
+                profile.dump_stats(
+                    PROFILES_PATH
+                    / f'{handler_name}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof'
+                )
+
+            if self.dump == ProfileDump.STACKS:
+                with (PROFILES_PATH / 'stacks.folded').open('a') as file:
+                    file.write(trace.format_stacks())
+
+
+profiler = Profiler()
+
+
+_no_span = nullcontext()
+
+
+def span(name: str) -> AbstractContextManager[None]:
+    """Time a stage of the handler if current update is sampled."""
+    if (trace := _current_trace.get()) is None:
+        return _no_span
+    return trace.span(name)
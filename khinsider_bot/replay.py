@@ -0,0 +1,450 @@
+"""Record webhook updates and replay them against local stand-ins."""
+
+import asyncio
+import json
+import secrets
+from collections.abc import AsyncGenerator, Generator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial
+from hashlib import blake2b
+from io import BytesIO
+from itertools import count
+from pathlib import Path
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+from time import monotonic, sleep
+from typing import Any, get_args, Self
+from unittest import mock
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message, PhotoSize, User
+from PIL import Image
+
+from .metrics import get_counter
+from .storage import JsonStorage
+
+# Fields which may identify a person and are not needed by handlers.
+PRIVATE_FIELDS = {
+    'last_name',
+    'username',
+    'phone_number',
+    'contact',
+    'location',
+    'venue',
+    'bio',
+    'forward_sender_name',
+    'sender_user_name',
+    'author_signature',
+    'forward_signature',
+    'sender_tag',
+}
+# Objects whose id field is a user or chat id.
+ID_OWNERS = {'from', 'chat', 'user', 'sender_chat', 'sender_user'}
+# Fields holding user or chat id outside of user or chat objects.
+ID_FIELDS = {'user_id', 'chat_id'}
+CHAT_TYPES = {'private', 'group', 'supergroup', 'channel'}
+
+
+def anonymize_id(id_: int, salt: bytes) -> int:
+    """Map id to a stable pseudonym, preserving the sign of chat ids."""
+    digest = blake2b(str(abs(id_)).encode(), key=salt, digest_size=6)
+    pseudonym = int.from_bytes(digest.digest())
+    return -pseudonym if id_ < 0 else pseudonym
+
+
+def anonymize_update(data: Any, salt: bytes, owner: str = '') -> Any:
+    """Strip personal data from raw update, keeping what handlers need."""
+    if isinstance(data, list):
+        return [anonymize_update(item, salt, owner) for item in data]
+
+    if not isinstance(data, dict):
+        return data
+
+    # Users and chats are met under many keys (forward_from, via_bot,
+    # new_chat_members, ...), so recognize them by their own fields too.
+    is_user_or_chat = (
+        owner in ID_OWNERS
+        or 'is_bot' in data
+        or 'first_name' in data
+        or data.get('type') in CHAT_TYPES
+    )
+
+    anonymized = {}
+    for key, value in data.items():
+        if key in PRIVATE_FIELDS:
+            continue
+        if isinstance(value, int) and (
+            key in ID_FIELDS or key == 'id' and is_user_or_chat
+        ):
+            anonymized[key] = anonymize_id(value, salt)
+        elif key in {'first_name', 'title'}:
+            anonymized[key] = 'Anonymous'
+        elif key in {'text', 'caption'} and not is_meaningful_text(value):
+            anonymized[key] = 'x' * len(value)
+        else:
+            anonymized[key] = anonymize_update(value, salt, key)
+
+    return anonymized
+
+
+def is_meaningful_text(text: str) -> bool:
+    """Check whether handlers may react to the text."""
+    return text.startswith('/') or 'khinsider.com' in text
+
+
+class UpdateRecorder:
+    """Append anonymized webhook updates to jsonl file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.salt = secrets.token_bytes(16)
+        self.started_at = monotonic()
+
+    def record(self, update: dict[str, Any]) -> None:
+        line = json.dumps(
+            {
+                'offset': monotonic() - self.started_at,
+                'update': anonymize_update(update, self.salt),
+            },
+            ensure_ascii=False,
+        )
+        with self.path.open('a') as file:
+            file.write(f'{line}\n')
+
+
+def load_recording(path: Path) -> list[dict[str, Any]]:
+    with path.open() as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class ReplaySession(BaseSession):
+    """Telegram stand-in which answers every request with dummy result."""
+
+    def __init__(self, latency: float) -> None:
+        super().__init__()
+        self.latency = latency
+        self.message_ids = count(1)
+
+    async def close(self) -> None:
+        pass
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod,
+        timeout: int | None = None,
+    ) -> Any:
+        await asyncio.sleep(self.latency)
+
+        result_types = get_args(method.__returning__) or (
+            method.__returning__,
+        )
+        if bool in result_types:
+            return True
+
+        if User in result_types:
+            # Without username, commands addressed to any bot name match.
+            return User(id=42, is_bot=True, first_name='Replay')
+
+        if Message in result_types:
+            chat_id = getattr(method, 'chat_id', None)
+            message_id = next(self.message_ids)
+            return Message(
+                message_id=message_id,
+                date=datetime.now(),
+                chat=Chat(
+                    id=chat_id if isinstance(chat_id, int) else 0,
+                    type='private',
+                ),
+                # Sent covers are cached by file id, so give them one.
+                photo=[
+                    PhotoSize(
+                        file_id=f'replay-photo-{message_id}',
+                        file_unique_id=f'replay-photo-{message_id}',
+                        width=1280,
+                        height=1280,
+                    )
+                ]
+                if method.__api_method__ == 'sendPhoto'
+                else None,
+            )
+
+        return None
+
+    async def stream_content(self, *args, **kwargs):
+        yield b''
+
+
+@dataclass
+class FakeAlbumShort:
+    slug: str
+    name: str
+
+
+@dataclass
+class FakeAlbum:
+    slug: str
+    name: str
+    year: str = '2000'
+    type: str = 'Soundtrack'
+    track_count: int = 10
+    thumbnail_urls: list[str] = field(default_factory=list)
+    track_urls: list[str] = field(default_factory=list)
+
+
+@dataclass
+class FakeAudioTrack:
+    mp3_url: str
+
+
+class FakeCoverSession:
+    """Aiohttp session stand-in, serving the same cover for every url."""
+
+    def __init__(self, cover: bytes, latency: float) -> None:
+        self.cover = cover
+        self.latency = latency
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        pass
+
+    @asynccontextmanager
+    async def get(self, url: str) -> AsyncGenerator[Self]:
+        await asyncio.sleep(self.latency)
+        yield self
+
+    def raise_for_status(self) -> None:
+        pass
+
+    async def read(self) -> bytes:
+        return self.cover
+
+
+class FakeKhinsider:
+    """Khinsider stand-in, returning generated data after a delay."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+
+        # Large enough to go through cover downscaling.
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 2000)).save(buffer, format='JPEG')
+        self.cover = buffer.getvalue()
+
+    def _wait(self) -> None:
+        # Real khinsider functions are blocking, so the stand-ins are too.
+        sleep(self.latency)
+
+    def get_album(self, album_slug: str) -> FakeAlbum:
+        self._wait()
+        return FakeAlbum(
+            slug=album_slug,
+            name=album_slug,
+            thumbnail_urls=[f'https://covers.invalid/{album_slug}.jpg'],
+            track_urls=[f'{album_slug}/{n}.mp3' for n in range(10)],
+        )
+
+    def get_track(self, album_slug: str, track_name: str) -> FakeAudioTrack:
+        self._wait()
+        return FakeAudioTrack(mp3_url=f'{album_slug}/{track_name}')
+
+    def fetch_tracks(self, *track_urls: str) -> Iterator[FakeAudioTrack]:
+        for track_url in track_urls:
+            self._wait()
+            yield FakeAudioTrack(mp3_url=track_url)
+
+    def search_albums(self, query: str, **_) -> list[FakeAlbumShort]:
+        self._wait()
+        return [
+            FakeAlbumShort(slug=f'{query}-{n}', name=f'{query} {n}')
+            for n in range(25)
+        ]
+
+    def get_publisher_albums(self, publisher: str) -> list[FakeAlbumShort]:
+        return self.search_albums(publisher)
+
+    def download_track_file(
+        self,
+        track: FakeAudioTrack,
+        download_dir: Path,
+    ) -> Path:
+        self._wait()
+        path = download_dir / track.mp3_url.replace('/', '_')
+        path.write_bytes(b'\0' * 1024)
+        return path
+
+    @contextmanager
+    def patch(self) -> Generator[None]:
+        """Replace khinsider functions used by the bot with stand-ins."""
+        from . import bot, catalog, thumbnails, transcoding, util
+
+        with (
+            mock.patch.multiple(
+                bot,
+                get_track=self.get_track,
+                fetch_tracks=self.fetch_tracks,
+                search_albums=self.search_albums,
+            ),
+            mock.patch.multiple(
+                catalog,
+                scrape_album=self.get_album,
+                scrape_publisher_albums=self.get_publisher_albums,
+                scrape_search_results=self.search_albums,
+            ),
+            mock.patch.multiple(
+                util,
+                download_track_file=self.download_track_file,
+            ),
+            mock.patch.multiple(
+                transcoding,
+                download_track_file=self.download_track_file,
+            ),
+            mock.patch.multiple(
+                thumbnails,
+                ClientSession=partial(
+                    FakeCoverSession,
+                    self.cover,
+                    self.latency,
+                ),
+            ),
+        ):
+            yield
+
+
+@contextmanager
+def isolate_storage() -> Generator[None]:
+    """Keep generated replay data out of the bot's persistent storage."""
+    from . import bot, catalog, thumbnails, transcoding
+
+    with TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir)
+        tmp_catalog = catalog.AlbumCatalog(
+            tmp_path / 'catalog.sqlite3',
+            max_age=catalog.catalog.max_age,
+        )
+
+        with (
+            mock.patch.multiple(bot, catalog=tmp_catalog),
+            mock.patch.multiple(catalog, catalog=tmp_catalog),
+            mock.patch.multiple(
+                thumbnails,
+                thumbnail_cache=JsonStorage(tmp_path / 'thumbnails.json'),
+            ),
+            mock.patch.multiple(
+                transcoding,
+                audio_formats=JsonStorage(tmp_path / 'audio_formats.json'),
+                ROOT_TRANSCODED_PATH=tmp_path / 'transcoded',
+            ),
+        ):
+            yield
+
+        tmp_catalog.connection.close()
+
+
+@dataclass
+class ReplayReport:
+    duration: float
+    latencies: list[float]
+    errors: int
+    handler_errors: int
+    throttled: int
+    overloaded: int
+
+    @property
+    def total(self) -> int:
+        return len(self.latencies) + self.errors
+
+    def format(self) -> str:
+        if not self.total:
+            return 'No updates were replayed'
+
+        throughput = self.total / max(self.duration, 1e-9)
+        lines = [
+            f'Updates: {self.total}',
+            f'Duration: {self.duration:.2f}s',
+            f'Throughput: {throughput:.2f} updates/s',
+            f'Errors: {self.errors} ({self.errors / self.total:.2%})',
+            # Handled by react_on_error, so the update itself succeeds.
+            f'Handler errors: {self.handler_errors}'
+            f' ({self.handler_errors / self.total:.2%})',
+            # Rejected updates are answered early and skew latencies down.
+            f'Throttled: {self.throttled} ({self.throttled / self.total:.2%})',
+            f'Overloaded: {self.overloaded}'
+            f' ({self.overloaded / self.total:.2%})',
+        ]
+
+        if len(self.latencies) > 1:
+            percentiles = quantiles(self.latencies, n=100, method='inclusive')
+            lines += [
+                f'Latency p{n}: {percentiles[n - 1] * 1000:.1f}ms'
+                for n in (50, 90, 99)
+            ]
+        if self.latencies:
+            lines.append(f'Latency max: {max(self.latencies) * 1000:.1f}ms')
+
+        return '\n'.join(lines)
+
+
+async def replay(
+    dispatcher: Dispatcher,
+    recording: list[dict[str, Any]],
+    speedup: float = 1.0,
+    telegram_latency: float = 0.05,
+    khinsider_latency: float = 0.2,
+) -> ReplayReport:
+    """Feed recorded updates to dispatcher, keeping their original pace."""
+    bot = Bot(
+        token='42:replay',
+        session=ReplaySession(telegram_latency),
+    )
+    latencies = []
+    errors = 0
+    counters = (
+        'bot_handler_errors_total',
+        'bot_throttled_updates_total',
+        'bot_overloaded_updates_total',
+    )
+    counters_before = [get_counter(name) for name in counters]
+
+    async def feed_update(update: dict[str, Any]) -> None:
+        nonlocal errors
+
+        start = monotonic()
+        try:
+            await dispatcher.feed_webhook_update(bot=bot, update=update)
+        except Exception:  # noqa: BLE001
+            # Any failure of a handler counts as replay error.
+            errors += 1
+            return
+        latencies.append(monotonic() - start)
+
+    with isolate_storage(), FakeKhinsider(khinsider_latency).patch():
+        started_at = monotonic()
+
+        async with asyncio.TaskGroup() as task_group:
+            for record in recording:
+                delay = record['offset'] / speedup - (monotonic() - started_at)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task_group.create_task(feed_update(record['update']))
+
+        duration = monotonic() - started_at
+
+    handler_errors, throttled, overloaded = (
+        int(get_counter(name) - before)
+        for name, before in zip(counters, counters_before, strict=True)
+    )
+    return ReplayReport(
+        duration=duration,
+        latencies=latencies,
+        errors=errors,
+        handler_errors=handler_errors,
+        throttled=throttled,
+        overloaded=overloaded,
+    )
@@ -0,0 +1,35 @@
+import json
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+
+class JsonStorage:
+    """Small key-value storage persisted to a json file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = Lock()
+
+        try:
+            self._data: dict[str, Any] = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._data = {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._dump()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._dump()
+
+    def _dump(self) -> None:
+        tmp_path = self.path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self._data))
+        tmp_path.replace(self.path)
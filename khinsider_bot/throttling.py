@@ -0,0 +1,157 @@
+import logging
+import re
+from collections import defaultdict, deque
+from collections.abc import Awaitable, Callable
+from time import monotonic
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+from khinsider import KHINSIDER_URL_REGEX
+
+from .enums import RequestKind
+from .metrics import inc_counter, set_gauge
+
+logger = logging.getLogger('khinsider_bot')
+
+Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+
+CALLBACK_PREFIXES = {
+    'download_album://': RequestKind.DOWNLOAD_ALBUM,
+    'select://': RequestKind.SELECT_ALBUM,
+    'page://': RequestKind.SWITCH_PAGE,
+}
+COMMANDS = {
+    '/search': RequestKind.SEARCH,
+    '/publisher': RequestKind.PUBLISHER,
+}
+
+# How often (in handled updates) to drop counters of idle users.
+CLEANUP_INTERVAL = 1000
+
+
+def get_request_kind(update: Update) -> RequestKind:
+    if (message := update.message) and message.text:
+        command, *_ = message.text.split(maxsplit=1) or ['']
+        # Commands in group chats may be addressed as /command@bot_name.
+        command, *_ = command.partition('@')
+        if kind := COMMANDS.get(command):
+            return kind
+        if re.search(KHINSIDER_URL_REGEX, message.text):
+            return RequestKind.KHINSIDER_URL
+
+    if (callback_query := update.callback_query) and callback_query.data:
+        for prefix, kind in CALLBACK_PREFIXES.items():
+            if callback_query.data.startswith(prefix):
+                return kind
+
+    return RequestKind.OTHER
+
+
+async def reject_update(update: Update, text: str, notify: bool) -> None:
+    """Answer rejected update in the cheapest way possible."""
+    # Callback queries must be answered anyway, so it costs nothing extra.
+    if isinstance(callback_query := update.event, CallbackQuery):
+        await callback_query.answer(text)
+        return
+
+    if notify and isinstance(message := update.event, Message):
+        await message.answer(text)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Drop updates over per-user rate limits or global concurrency limit."""
+
+    def __init__(
+        self,
+        limits: dict[RequestKind, tuple[int, int]],
+        max_concurrent_updates: int,
+    ) -> None:
+        self.limits = limits
+        self.max_concurrent_updates = max_concurrent_updates
+
+        self.active_updates = 0
+        self.handled_updates = 0
+        self.hits: defaultdict[tuple[int, RequestKind], deque[float]] = (
+            defaultdict(deque)
+        )
+        self.notified_at: dict[tuple[int, RequestKind], float] = {}
+
+    def is_rate_limited(self, key: tuple[int, RequestKind]) -> bool:
+        """Check sliding window limit and record the hit if allowed."""
+        limit, window = self.limits[key[1]]
+        now = monotonic()
+
+        hits = self.hits[key]
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+
+        if len(hits) >= limit:
+            return True
+
+        hits.append(now)
+        return False
+
+    def should_notify(self, key: tuple[int, RequestKind]) -> bool:
+        """Notify user about rejection at most once per window."""
+        _, window = self.limits[key[1]]
+        now = monotonic()
+
+        if now - self.notified_at.get(key, -window) < window:
+            return False
+
+        self.notified_at[key] = now
+        return True
+
+    def cleanup(self) -> None:
+        now = monotonic()
+        for key in list(self.hits):
+            _, window = self.limits[key[1]]
+            if not (hits := self.hits[key]) or hits[-1] <= now - window:
+                del self.hits[key]
+                self.notified_at.pop(key, None)
+
+    async def __call__(
+        self,
+        handler: Handler,
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        kind = get_request_kind(event)
+        inc_counter('bot_updates_total', kind=kind)
+
+        self.handled_updates += 1
+        if self.handled_updates % CLEANUP_INTERVAL == 0:
+            self.cleanup()
+
+        if (user := data.get('event_from_user')) and self.is_rate_limited(
+            key := (user.id, kind)
+        ):
+            inc_counter('bot_throttled_updates_total', kind=kind)
+            await reject_update(
+                event,
+                'Too many requests! Please, wait a bit.',
+                notify=self.should_notify(key),
+            )
+            return None
+
+        if self.active_updates >= self.max_concurrent_updates:
+            inc_counter('bot_overloaded_updates_total', kind=kind)
+            logger.warning(f'Dropped {kind} update: bot is overloaded')
+            await reject_update(
+                event,
+                'Bot is overloaded! Please, try again later.',
+                notify=kind != RequestKind.OTHER,
+            )
+            return None
+
+        self.active_updates += 1
+        set_gauge('bot_active_updates', self.active_updates)
+        try:
+            return await handler(event, data)
+        finally:
+            self.active_updates -= 1
+            set_gauge('bot_active_updates', self.active_updates)
@@ -0,0 +1,80 @@
+from asyncio import to_thread
+from io import BytesIO
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import (
+    BufferedInputFile,
+    InputFile,
+    Message,
+    URLInputFile,
+)
+from aiohttp import ClientSession
+from PIL import Image
+
+from .config import THUMBNAIL_MAX_SIZE
+from .constants import THUMBNAIL_CACHE_PATH
+from .profiling import span
+from .storage import JsonStorage
+
+thumbnail_cache = JsonStorage(THUMBNAIL_CACHE_PATH)
+
+
+def downscale_image(image_bytes: bytes, max_size: int) -> bytes | None:
+    """Shrink image to fit max_size box. Return None if it already fits."""
+    with Image.open(BytesIO(image_bytes)) as image:
+        if max(image.size) <= max_size:
+            return None
+
+        image = image.convert('RGB')
+        image.thumbnail((max_size, max_size))
+
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+
+    return buffer.getvalue()
+
+
+async def get_thumbnail_file(url: str) -> InputFile:
+    """Get album cover as input file, downscaling it if it is too large."""
+    if not THUMBNAIL_MAX_SIZE:
+        return URLInputFile(url)
+
+    with span('download'):
+        async with ClientSession() as session, session.get(url) as response:
+            response.raise_for_status()
+            image_bytes = await response.read()
+
+    filename = url.rsplit('/', maxsplit=1)[-1]
+
+    with span('resize'):
+        resized = await to_thread(
+            downscale_image,
+            image_bytes,
+            THUMBNAIL_MAX_SIZE,
+        )
+
+    if resized:
+        return BufferedInputFile(resized, filename=f'{filename}.jpg')
+
+    return BufferedInputFile(image_bytes, filename=filename)
+
+
+async def send_album_thumbnail(
+    message: Message,
+    album_slug: str,
+    thumbnail_url: str,
+) -> None:
+    """Reply with album cover, reusing telegram file id when possible."""
+    if file_id := thumbnail_cache.get(album_slug):
+        try:
+            await message.reply_photo(file_id)
+            return
+        except TelegramBadRequest:
+            thumbnail_cache.delete(album_slug)
+
+    sent_message = await message.reply_photo(
+        await get_thumbnail_file(thumbnail_url)
+    )
+
+    if sent_message.photo:
+        thumbnail_cache.set(album_slug, sent_message.photo[-1].file_id)
@@ -0,0 +1,178 @@
+import os
+import shutil
+import subprocess
+from asyncio import Future, get_running_loop, to_thread
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import md5
+from pathlib import Path
+from urllib.parse import unquote
+
+from khinsider import AudioTrack, download_track_file
+
+from .config import TRANSCODE_CACHE_MAX_SIZE, TRANSCODE_WORKERS
+from .constants import AUDIO_FORMATS_PATH, ROOT_TRANSCODED_PATH
+from .enums import AudioFormat
+from .profiling import span
+from .storage import JsonStorage
+
+FFMPEG_PATH = shutil.which('ffmpeg')
+
+# Transcoded tracks which are not smaller than their source (e.g. from
+# low bitrate mp3 files) are discarded, and the original is sent instead.
+FFMPEG_CODEC_ARGS = {
+    AudioFormat.AAC: ('-codec:a', 'aac', '-b:a', '128k'),
+    AudioFormat.OPUS: ('-codec:a', 'libopus', '-b:a', '96k'),
+}
+FILE_EXTENSIONS = {
+    AudioFormat.AAC: 'm4a',
+    AudioFormat.OPUS: 'opus',
+}
+
+executor = ProcessPoolExecutor(max_workers=TRANSCODE_WORKERS)
+audio_formats = JsonStorage(AUDIO_FORMATS_PATH)
+
+_pending_transcodes: dict[Path, Future] = {}
+
+
+def is_transcoding_available() -> bool:
+    return FFMPEG_PATH is not None
+
+
+def get_audio_format(chat_id: int) -> AudioFormat:
+    """Get audio format preferred by chat."""
+    audio_format = audio_formats.get(str(chat_id), AudioFormat.ORIGINAL)
+
+    # Formats may be removed, while chats still have them stored.
+    if audio_format not in AudioFormat:
+        return AudioFormat.ORIGINAL
+    return AudioFormat(audio_format)
+
+
+def set_audio_format(chat_id: int, audio_format: AudioFormat) -> None:
+    audio_formats.set(str(chat_id), audio_format.value)
+
+
+def get_transcoded_filename(
+    track: AudioTrack,
+    audio_format: AudioFormat,
+) -> str:
+    """Get human-readable file name for the transcoded track."""
+    filename = unquote(track.mp3_url.rsplit('/', maxsplit=1)[-1])
+    stem, *_ = filename.rpartition('.')
+    return f'{stem or filename}.{FILE_EXTENSIONS[audio_format]}'
+
+
+def get_transcoded_path(
+    track: AudioTrack,
+    audio_format: AudioFormat,
+) -> Path:
+    track_hash = md5(track.mp3_url.encode()).hexdigest()
+    return (
+        ROOT_TRANSCODED_PATH
+        / audio_format
+        / f'{track_hash}.{FILE_EXTENSIONS[audio_format]}'
+    )
+
+
+def transcode_file(
+    ffmpeg_path: str,
+    source: Path,
+    target: Path,
+    codec_args: tuple[str, ...],
+) -> None:
+    """Transcode audio file with ffmpeg. Runs inside worker process."""
+    target.parent.mkdir(exist_ok=True, parents=True)
+    partial_target = target.with_name(f'{target.stem}.part{target.suffix}')
+
+    subprocess.run(
+        [
+            ffmpeg_path,
+            '-y',
+            '-loglevel',
+            'error',
+            '-i',
+            source,
+            '-vn',
+            '-map_metadata',
+            '0',
+            *codec_args,
+            partial_target,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    partial_target.replace(target)
+
+
+def get_skip_marker_path(target: Path) -> Path:
+    """Get path of marker telling transcoding this track is pointless."""
+    return target.with_suffix('.skip')
+
+
+def prune_transcoded_tracks(max_size: int) -> None:
+    """Remove least recently used transcoded tracks above max_size."""
+    files = [
+        (path, path.stat())
+        for path in ROOT_TRANSCODED_PATH.glob('*/*')
+        if '.part' not in path.suffixes
+    ]
+    total_size = sum(stat.st_size for _, stat in files)
+
+    for path, stat in sorted(files, key=lambda file: file[1].st_mtime):
+        if total_size <= max_size:
+            break
+        path.unlink(missing_ok=True)
+        total_size -= stat.st_size
+
+
+async def transcode_track(
+    track: AudioTrack,
+    audio_format: AudioFormat,
+    download_dir: Path,
+) -> Path | None:
+    """Get track transcoded to the audio format, using disk cache.
+
+    Returns None if transcoded track is not smaller than the original.
+    """
+    target = get_transcoded_path(track, audio_format)
+    skip_marker = get_skip_marker_path(target)
+
+    for path in (target, skip_marker):
+        if path.exists():
+            # Modification time marks last use for the cache pruning.
+            os.utime(path)
+            return target if path == target else None
+
+    # Several users may request the same track at once, transcode it once.
+    if pending := _pending_transcodes.get(target):
+        await pending
+        if skip_marker.exists():
+            return None
+        if not target.exists():
+            raise RuntimeError(f'Failed to transcode {track.mp3_url}')
+        return target
+
+    loop = get_running_loop()
+    _pending_transcodes[target] = loop.create_future()
+
+    try:
+        with span('download'):
+            source = await to_thread(download_track_file, track, download_dir)
+        with span('transcode'):
+            await loop.run_in_executor(
+                executor,
+                transcode_file,
+                FFMPEG_PATH,
+                source,
+                target,
+                FFMPEG_CODEC_ARGS[audio_format],
+            )
+
+        if target.stat().st_size >= source.stat().st_size:
+            target.unlink()
+            skip_marker.touch()
+    finally:
+        _pending_transcodes.pop(target).set_result(None)
+
+    await to_thread(prune_transcoded_tracks, TRANSCODE_CACHE_MAX_SIZE)
+    return None if skip_marker.exists() else target
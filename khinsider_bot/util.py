@@ -1,3 +1,5 @@
+import logging
+from asyncio import gather
 from contextlib import suppress
 from pathlib import Path
 from time import sleep
@@ -10,18 +12,28 @@ from aiogram.types import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message,
-    URLInputFile,
 )
 from khinsider import (
     Album,
     AlbumShort,
     AudioTrack,
     download_track_file,
-    get_album,
 )
 from khinsider.cache import CacheManager
 
+from .catalog import CatalogAlbum, CatalogAlbumShort, get_album
 from .constants import LIST_PAGE_LENGTH
+from .enums import AudioFormat
+from .profiling import span
+from .thumbnails import send_album_thumbnail
+from .transcoding import (
+    get_audio_format,
+    get_transcoded_filename,
+    is_transcoding_available,
+    transcode_track,
+)
+
+logger = logging.getLogger('khinsider_bot')
 
 
 def batch_list(
@@ -34,7 +46,7 @@ def batch_list(
     ]
 
 
-def format_album_info(album: Album) -> str:
+def format_album_info(album: Album | CatalogAlbum) -> str:
     return (
         f'{album.name}\n'
         f'Year: {album.year}\n'
@@ -44,7 +56,7 @@ def format_album_info(album: Album) -> str:
 
 
 def format_search_results(
-    search_results: list[AlbumShort],
+    search_results: list[AlbumShort] | list[CatalogAlbumShort],
     page_num: int = 0,
 ) -> str:
     return ''.join(
@@ -68,13 +80,25 @@ async def send_album_data(
     cache_manager = CacheManager.get_manager()
     md5_hash = cache_manager.cache_object(album_slug)
 
-    if album.thumbnail_urls:
-        await message.reply_photo(URLInputFile(album.thumbnail_urls[0]))
+    with span('format'):
+        album_info = format_album_info(album)
+        keyboard = get_album_keyboard(md5_hash)
 
-    await message.reply(
-        text=format_album_info(album),
-        reply_markup=get_album_keyboard(md5_hash),
-    )
+    async def _send_info() -> None:
+        await message.reply(text=album_info, reply_markup=keyboard)
+
+    async def _send_thumbnail(thumbnail_url: str) -> None:
+        # Album card is still useful without the cover.
+        try:
+            await send_album_thumbnail(message, album_slug, thumbnail_url)
+        except Exception:
+            logger.exception(f"Couldn't send cover of {album_slug}")
+
+    if not album.thumbnail_urls:
+        await _send_info()
+        return
+
+    await gather(_send_thumbnail(album.thumbnail_urls[0]), _send_info())
 
 
 async def send_audio_track(
@@ -82,49 +106,72 @@ async def send_audio_track(
     track: AudioTrack,
     download_dir: Path,
 ) -> None:
-    async def _send_track(from_):
+    async def _send_track(from_, send=message.answer_audio):
         await message.chat.do(ChatAction.UPLOAD_DOCUMENT)
         sleep(0.5)
-        await message.answer_audio(from_)
+        await send(from_)
         sleep(0.1)
 
+    audio_format = get_audio_format(message.chat.id)
+
+    if audio_format != AudioFormat.ORIGINAL and is_transcoding_available():
+        try:
+            # Track is sent as is, if transcoding doesn't make it smaller.
+            if transcoded_file := await transcode_track(
+                track,
+                audio_format,
+                download_dir,
+            ):
+                await _send_track(
+                    BufferedInputFile.from_file(
+                        transcoded_file,
+                        filename=get_transcoded_filename(track, audio_format),
+                    ),
+                    # Telegram audio player only supports mp3 and m4a files.
+                    send=(
+                        message.answer_document
+                        if audio_format == AudioFormat.OPUS
+                        else message.answer_audio
+                    ),
+                )
+                return
+        except Exception:
+            logger.exception(
+                f'Failed to send {audio_format} track {track.mp3_url},'
+                ' sending original file instead'
+            )
+
     try:
         with suppress(TelegramBadRequest):
             await _send_track(track.mp3_url)
             return
-        await _send_track(
-            BufferedInputFile.from_file(
-                download_track_file(
-                    track,
-                    download_dir,
-                )
-            )
-        )
+        with span('download'):
+            track_file = download_track_file(track, download_dir)
+        await _send_track(BufferedInputFile.from_file(track_file))
     except Exception as e:
         await message.answer(f'Error for track {track.mp3_url}: {e}')
 
 
 async def send_album_list(
     message: Message,
-    list_page: list[AlbumShort],
+    list_page: list[AlbumShort] | list[CatalogAlbumShort],
     list_md5: str,
     current_page_num: int,
     last_page_num: int,
 ) -> None:
-    keyboard = get_list_select_keyboard(
-        list_md5,
-        current_page_num,
-        last_page_num,
-        len(list_page),
-    )
-
-    await message.answer(
-        format_search_results(
+    with span('format'):
+        keyboard = get_list_select_keyboard(
+            list_md5,
+            current_page_num,
+            last_page_num,
+            len(list_page),
+        )
+        text = format_search_results(
             list_page,
             current_page_num,
-        ),
-        reply_markup=keyboard,
-    )
+        )
+
+    await message.answer(text, reply_markup=keyboard)
 
 
 def get_album_keyboard(download_hash: str) -> InlineKeyboardMarkup: